@@ -1,8 +1,10 @@
 import asyncio
+import bisect
 
 import aiomas
 from aiomas import expose
 import logging
+import numpy as np
 
 from controller.core.management import TopologyManager
 
@@ -66,8 +68,10 @@ class ControllerAgent(aiomas.Agent):
         """
         super().__init__(container)
 
-        self._agents = {}       # dict mapping from agent_instance to agent_addr
-        self._agent_names = {}  # dict mapping from agnet_addr to agent_name
+        # Registered agents as parallel lists, sorted by agent address
+        self._agents = []       # agent proxies
+        self._agent_addrs = []  # agent addresses
+        self._agent_names = []  # agent names
         self._n_agents = n_agents
         self._agents_registered = asyncio.Future()
         if n_agents is None:
@@ -89,6 +93,7 @@ class ControllerAgent(aiomas.Agent):
         self._neg_timeout = negotiation_timeout
         self._task_negotiation = None
         self._neg_done = None
+        self._solution = {}  # agent address: schedule id of last negotiation
         
     @expose
     async def stop(self):
@@ -107,11 +112,27 @@ class ControllerAgent(aiomas.Agent):
         with the address *addr*
         """
         logger.debug('[Controller] unitAgent registered: %s' % addr)
-        self._agents[agent_proxy] = addr
-        self._agent_names[addr] = name if name else addr
+        i = bisect.bisect_left(self._agent_addrs, addr)
+        if i < len(self._agent_addrs) and self._agent_addrs[i] == addr:
+            # Already registered, only update the agent's data
+            self._agents[i] = agent_proxy
+            self._agent_names[i] = name if name else addr
+            return
+        self._agents.insert(i, agent_proxy)
+        self._agent_addrs.insert(i, addr)
+        self._agent_names.insert(i, name if name else addr)
         if self._n_agents is not None and len(self._agents) == self._n_agents:
             self._agents_registered.set_result(True)
             
+    @expose
+    def register_unitAgents(self, agents):
+        """
+        Register a batch of unitAgents, *agents* is a list of
+        *(agent_proxy, addr, name)* tuples
+        """
+        for agent_proxy, addr, name in agents:
+            self.register_unitAgent(agent_proxy, addr, name)
+
     @expose
     def register_observer(self, agent_proxy):
         """
@@ -126,7 +147,13 @@ class ControllerAgent(aiomas.Agent):
     async def run_negotiation(self, startdate, target_schedule, weights):
         """
         Start the negotations
+
+        *target_schedule* and *weights* may be lists or NumPy arrays.  They
+        are converted to float arrays before they are passed to the observer
+        and the unit agents.
         """
+        target_schedule = np.asarray(target_schedule, dtype=np.float64)
+        weights = np.asarray(weights, dtype=np.float64)
         self._neg_done = asyncio.Future()
         # initialize negotiation
         await self.init_negotiation(target_schedule, weights, startdate)
@@ -149,8 +176,9 @@ class ControllerAgent(aiomas.Agent):
          
         logger.debug('[ControllerAgent] Build topology for new negotiation')
         # build topology with topology manager
-        topology = self._topology_manager.make_topology(self._agents)
-        conn_data = self._topology_manager.topology_as_list(self._agent_names)  # for observer
+        topology = self._topology_manager.make_topology(len(self._agents))
+        conn_data = self._topology_manager.topology_as_list(
+            topology, self._agent_names)  # for observer
 
         # begin observation of negotiation
         if self._observer is None:
@@ -158,17 +186,24 @@ class ControllerAgent(aiomas.Agent):
         await self._observer.start_observation(conn_data, startdate,
                                                     target_schedule, weights)
 
+        # neighbor addresses for each agent
+        indptr, indices = topology
+        addrs = self._agent_addrs
+        neighbors = [tuple(addrs[j] for j in indices[indptr[i]:indptr[i + 1]])
+                     for i in range(len(addrs))]
+
+        # tell units about new negotiation
+        await asyncio.gather(*[a.new_negotiation() for a in self._agents])
         # call store topology for all agents
-        for a in self._agents:
-            # tell unit about new negotiation
-            await a.new_negotiation()
-            await a.store_topology(
-                self.addr, tuple(topology[a]), target_schedule,
+        await asyncio.gather(*[
+            a.store_topology(
+                self.addr, neighbors[i], target_schedule,
                 weights, self._scheduling_res, self._scheduling_intervals, startdate)
+            for i, a in enumerate(self._agents)])
 
         # initialize negotiation by calling init_negotiation of one agent
         logger.debug('[ControllerAgent] Initializing new negotiation for %s' % startdate)
-        for agent in self._agents.keys():
+        for agent in self._agents:
             await agent.init_negotiation()
             if self._neg_single_start:
                 break 
@@ -177,7 +212,7 @@ class ControllerAgent(aiomas.Agent):
         """
         Stop negotiation for each agent
         """
-        futs = [agent.stop_negotiation() for agent in self._agents.keys()]
+        futs = [agent.stop_negotiation() for agent in self._agents]
         logger.debug('[ControllerAgent] send stop_negotiation to all agents')
         await asyncio.gather(*futs)
             
@@ -189,6 +224,14 @@ class ControllerAgent(aiomas.Agent):
         """
         logger.debug('[Controller] Negotiation finished - info received by observer.')
         self._neg_done.set_result(True)
+
+    @expose
+    def collect_schedules(self):
+        """
+        Return a dict *{agent address: schedule id}* with the schedules chosen
+        in the last negotiation.
+        """
+        return self._solution
         
     async def _broadcast_solution(self, solution):
         """
@@ -199,8 +242,10 @@ class ControllerAgent(aiomas.Agent):
         logger.info("[Controller] Broadcast solution: %s Performance: %s"
               %(solution.sids, solution.perf))
         # inform all agents about their schedule id
-        for agent, addr in self._agents.items():
+        self._solution = {}
+        for agent, addr in zip(self._agents, self._agent_addrs):
             schedule_id = solution.sids[solution.idx[addr]]
+            self._solution[addr] = schedule_id
             futs.append(agent.set_schedule(schedule_id))
         await asyncio.gather(*futs)
 
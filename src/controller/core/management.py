@@ -1,80 +1,109 @@
 import random
 
+import numpy as np
+
 
 class TopologyManager:
-    """Builds and manages the small world topology of a COHDA-based MAS.
+    """Builds the small world topology of a COHDA-based MAS.
+
+    Agents are identified by integer IDs ``0 .. n_agents - 1``, which should
+    correspond to the agents sorted by their address.  Topologies are
+    returned in CSR form as tuple *(indptr, indices)*: the neighbors of agent
+    *i* are ``indices[indptr[i]:indptr[i + 1]]``.
+
+    The manager does not keep any state about the topologies it creates.
 
     """
     def __init__(self, phi=1, seed=None):
-        self._agent_addresses = None
-        self._topology = None
         self._topology_phi = phi
         self._topology_seed = seed
 
-    def make_topology(self, agents):
-        # agent_addresses is a dict of agent proxies: agent address
-        self._agent_addresses = agents
-        assert self._agent_addresses is not None
+    def make_topology(self, n_agents):
+        """Build a new topology for *n_agents* agents and return it as
+        tuple *(indptr, indices)*.
+
+        """
         # All connections must be symetric and irreflexive.
         # That means, for each connection A -> B:
         # - A != B (no connection to self)
         # - If A connects to B, than B connects to A
-        n_agents = len(self._agent_addresses)
-
-        # Build list of agent proxies sorted by their address
-        agent_list = [a for a, _ in sorted(self._agent_addresses.items(),
-                                           key=lambda x: x[1])]
-        # MNW: Does that not have to be {agent: set() for agent in agent_list}?
-        self._topology = {agent: set() for agent in self._agent_addresses}
-        if n_agents == 1:
-            return self._topology
-
-        self._build_ring(agent_list, n_agents)
-        self._add_random_topology(agent_list)
-        return self._topology
-
-    def _build_ring(self, agent_list, n_agents):
-        for i, agent in enumerate(agent_list):
-            # Get left and right agent
-            agent_left = agent_list[(i - 1) % n_agents]
-            agent_right = agent_list[(i + 1) % n_agents]
-
-            # Add addresses of left and right to the agents connect-set
-            self._topology[agent].add(self._agent_addresses[agent_left])
-            self._topology[agent].add(self._agent_addresses[agent_right])
-
-    def _add_random_topology(self, agent_list):
-        rnd = random.Random(self._topology_seed)
+        adj = np.zeros((n_agents, n_agents), dtype=bool)
 
-        # Add some random connections ("small world")
-        for _ in range(int(len(agent_list) * self._topology_phi)):
-            # We'll get *at most* n_agent * phi connections.
+        if n_agents > 1:
+            self._build_ring(adj, n_agents)
+            self._add_random_topology(adj, n_agents)
 
-            agent_a = rnd.choice(agent_list)
-            agent_b = rnd.choice(agent_list)
+        indptr = np.zeros(n_agents + 1, dtype=int)
+        np.cumsum(adj.sum(axis=1), out=indptr[1:])
+        indices = np.nonzero(adj)[1]
+        return indptr, indices
 
-            if agent_a is agent_b:
-                continue
+    def _build_ring(self, adj, n_agents):
+        # Connect each agent with its left and right neighbor
+        idx = np.arange(n_agents)
+        idx_right = (idx + 1) % n_agents
+        adj[idx, idx_right] = True
+        adj[idx_right, idx] = True
 
-            self._topology[agent_a].add(self._agent_addresses[agent_b])
-            self._topology[agent_b].add(self._agent_addresses[agent_a])
+    def _add_random_topology(self, adj, n_agents):
+        rnd = random.Random(self._topology_seed)
 
-    def topology_as_list(self, agent_names):
-        """Return the topology as list of tuples (agent_1, agent_2), to
+        # Add some random connections ("small world")
+        # We'll get *at most* n_agent * phi new connections, because some of
+        # the sampled pairs may already be connected by the ring.
+        # Sample indices into the (virtual) list of all pairs as created by
+        # ``itertools.combinations(range(n_agents), 2)`` and decode them, so
+        # we don't need to build that list.  The result is the same.
+        n_pairs = n_agents * (n_agents - 1) // 2
+        k = min(int(n_agents * self._topology_phi), n_pairs)
+        if k == 0:
+            return
+
+        i, j = np.array([_decode_pair(m, n_agents, n_pairs)
+                         for m in rnd.sample(range(n_pairs), k)]).T
+        adj[i, j] = True
+        adj[j, i] = True
+
+    @staticmethod
+    def topology_as_list(topology, agent_names):
+        """Return the *topology* as list of tuples (agent_1, agent_2), to
         be understood as bidirectional
-        :param agent_names: dictionary mapping from agent_addr to agent
+        :param topology: tuple *(indptr, indices)* from :meth:`make_topology`
+        :param agent_names: list of agent names indexed by agent ID
 
         """
-        assert self._topology is not None
-        assert self._agent_addresses is not None
-
-        connections = set()
-        for agent_proxy, remotes in self._topology.items():
-            # Convert proxy to str
-            agent_addr = self._agent_addresses[agent_proxy]
-            for others_addr in remotes:  # remotes is already list of addresses as string
-                # Merge two directed connections into one bidirectional one
-                con = (agent_names[agent_addr], agent_names[others_addr]) if agent_addr < others_addr else (agent_names[others_addr], agent_names[agent_addr])
-                connections.add(con)
-        topology_list = sorted(connections)
-        return topology_list
+        indptr, indices = topology
+        rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        # Keep every bidirectional connection once with i < j, so the pairs
+        # are already in canonical order.
+        upper = rows < indices
+        return sorted((agent_names[i], agent_names[j])
+                      for i, j in zip(rows[upper], indices[upper]))
+
+
+def _decode_pair(m, n, n_pairs):
+    """Return the pair *(i, j)* at index *m* of
+    ``list(itertools.combinations(range(n), 2))``.
+
+    *n_pairs* is the number of pairs, ``n * (n - 1) // 2``.
+
+    """
+    # Count from the end: the last *r* pairs start with ``n - 2 - x``
+    # where *x* is the largest number with ``x * (x + 1) // 2 <= r``.
+    r = n_pairs - 1 - m
+    x = (_isqrt(8 * r + 1) - 1) // 2
+    i = n - 2 - x
+    j = m - n_pairs + (n - i) * (n - i - 1) // 2 + i + 1
+    return i, j
+
+
+def _isqrt(n):
+    """Return the integer square root of the non-negative int *n*."""
+    if n == 0:
+        return 0
+    x = 1 << ((n.bit_length() + 1) // 2)
+    while True:
+        y = (x + n // x) // 2
+        if y >= x:
+            return x
+        x = y
@@ -5,6 +5,15 @@ import aiomas
 import click
 
 import isaac_util.util as util
+import unit
+
+logger = logging.getLogger(__name__)
+
+# Printed to stdout as soon as the container accepts connections
+READY_MSG = 'READY'
+
+# Max. number of unit agents connecting to controller/observer at once
+CONNECT_CONCURRENCY = 64
 
 
 @click.command()
@@ -31,11 +40,30 @@ def main(addr, start_date, log_level, log_file):
     initialize_logger(log_level, log_file)
     container_kwargs = util.get_container_kwargs(start_date)
     try:
-        aiomas.run(aiomas.subproc.start(addr, **container_kwargs))
+        aiomas.run(start(addr, **container_kwargs))
     finally:
         asyncio.get_event_loop().close()
 
 
+async def start(addr, **container_kwargs):
+    """Like :func:`aiomas.subproc.start()`, but print :data:`READY_MSG` to
+    stdout as soon as the container and its manager agent are ready, so that
+    the parent process does not need to poll for the connection.
+
+    """
+    container_kwargs.update(as_coro=True)
+    container = await aiomas.Container.create(addr, **container_kwargs)
+    unit.configure_connect_gate(CONNECT_CONCURRENCY)
+    try:
+        manager = aiomas.subproc.Manager(container)
+        print(READY_MSG, flush=True)
+        await manager.stop_received
+    except KeyboardInterrupt:
+        logger.info('Execution interrupted by user')
+    finally:
+        await container.shutdown(as_coro=True)
+
+
 def initialize_logger(log_level, log_file):
     """
     Initializes logger
@@ -3,6 +3,8 @@ import json
 import mosaik_api
 import logging
 
+import numpy as np
+
 
 logger = logging.getLogger(__name__)
 
@@ -25,21 +27,16 @@ class ExampleDER:
             header_line = next(schedule_file).strip()
             headers = json.loads(header_line)
 
-            # read and verify possible schedules
-            content = schedule_file.readlines()
+            # read possible schedules, one column per schedule
             schedule_count = len(headers['cols'])
-            for _ in range(schedule_count):
-                self.possible_schedules.append([])
+            data = np.loadtxt(schedule_file, delimiter=',', dtype=np.float64,
+                              usecols=range(schedule_count), ndmin=2)
 
             # extract the data per schedule
-            for line in content:
-                data = line.strip().split(',')
-                for n in range(schedule_count):
-                    self.possible_schedules[n].append(float(data[n]))
+            self.possible_schedules = data.T.tolist()
 
             # fill schedule_dict
-            for index, schedule in enumerate(self.possible_schedules):
-                self._schedule_dict[index] = schedule
+            self._schedule_dict = dict(enumerate(self.possible_schedules))
 
 
 class ExampleDERSim(mosaik_api.Simulator):
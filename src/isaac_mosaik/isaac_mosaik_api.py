@@ -1,27 +1,44 @@
 import asyncio
+import functools
+import itertools
 import sys
 import logging
 import multiprocessing
+import shutil
 import numpy as np
 import time
 
 # imports in order to read target file
 import os.path
-import json
 import lzma
-import io
+try:
+    import orjson as json_lib  # faster, if available
+except ImportError:
+    import json as json_lib
 
 from aiomas import expose
 import aiomas
 import arrow
 import click
 
-import controller.controller as controller
-import observer.observer as observer
+from isaac_mosaik.container import READY_MSG
 import isaac_util.util as util
 
 logger = logging.getLogger(__name__)
 
+# Default for the maximum number of concurrent requests to agents/containers
+MAX_CONCURRENCY = 64
+
+# Max. number of seconds to wait for an agent container to become ready
+READY_TIMEOUT = 30
+
+# Codecs for the connection to mosaik
+CODECS = {
+    'json': aiomas.JSON,
+    'msgpack': aiomas.MsgPack,
+    'msgpack-blosc': aiomas.MsgPackBlosc,
+}
+
 
 @click.command()
 @click.option('--log-level', '-l', default='info', show_default=True,
@@ -30,16 +47,17 @@ logger = logging.getLogger(__name__)
               help='Log level for the MAS')
 @click.option('--log-file', '-lf', default='isaac.log', show_default=True,
               help='Log file for the MAS')
+@click.option('--codec', '-c', default='json', show_default=True,
+              type=click.Choice(sorted(CODECS)),
+              help='Codec for the connection to mosaik (must be supported '
+                   'by mosaik)')
 @click.argument('addr', metavar='HOST:PORT', callback=util.validate_addr)
-def main(addr, log_level, log_file):
+def main(addr, log_level, log_file, codec):
     """Open VPP multi-agent system."""
     try:
-        # change event loop in case the platform is windows
-        if sys.platform == 'win64' or sys.platform == 'win32':
-            loop = asyncio.ProactorEventLoop()
-            asyncio.set_event_loop(loop)
+        util.setup_event_loop()
         initialize_logger(log_level, log_file)
-        aiomas.run(until=run(addr, log_level, log_file))
+        aiomas.run(until=run(addr, log_level, log_file, CODECS[codec]))
     finally:
         asyncio.get_event_loop().close()
 
@@ -60,14 +78,14 @@ def initialize_logger(log_level, log_file):
     logging.getLogger('').addHandler(util.get_log_console_handler())
 
 
-async def run(addr, log_level, log_file):
+async def run(addr, log_level, log_file, codec=aiomas.JSON):
     mosaik_api = MosaikAPI(log_level, log_file)
     try:
         # Create an RPC connection to mosaik. It will handle all incoming
         # requests until one of them sets a result for "self.stopped".
         logger.debug('Connecting to %s:%s ...' % addr)
         mosaik_con = await aiomas.rpc.open_connection(
-            addr, rpc_service=mosaik_api, codec=aiomas.JSON)
+            addr, rpc_service=mosaik_api, codec=codec)
         mosaik_api.mosaik = mosaik_con.remote
 
         def on_connection_reset_cb(exc):
@@ -100,6 +118,7 @@ class MosaikAPI:
         self.host = host
         self.port_start = port_start + 1
         self.step_size = 1 * 60 * 60 * 24  # seconds. can be overwritten in config['negotiation_details']['step_size']
+        self.concurrency = MAX_CONCURRENCY  # can be overwritten in config['concurrency']
 
         self.meta = {
             # TODO check what the api_version flag stands for - is it needed?
@@ -126,6 +145,7 @@ class MosaikAPI:
 
         # Set in init()
         self.sid = None
+        self._aid_prefix = None  # prefix for agent IDs ("<sid>.")
         self.n_agents = None
         self.config = None
         self.container = None  # Container for all agents (all local)
@@ -136,11 +156,15 @@ class MosaikAPI:
 
         self.agent_containers = []  # Proxies to agent containers
         self.container_procs = []  # Open instances for agent containers
+        self._output_tasks = []  # Tasks forwarding the containers' stdout
 
         # Set/updated in create()/setup_done()
         self._aids = []
         self._created_agents = 0
         self._agents = {}  # UnitAgents
+        self._uid_by_aid = {}  # aid: uid of the connected unit
+        self._addr_by_aid = {}  # aid: address of the spawned UnitAgent
+        self._outputs = {}  # outputs for mosaik.set_data(), reused in each step
         self._t_last_step = None  # needed in case of some real time requirement
 
         # negotiation details
@@ -150,18 +174,20 @@ class MosaikAPI:
     async def finalize(self):
         """Stop all agents, containers and subprocesses when the simulation
         finishes."""
-        futs = [a.stop() for a in self._agents.values()]
-        futs += [c.stop() for c in self.agent_containers]
-        await asyncio.gather(*futs)
+        await util.gather_bounded(
+            lambda proxy: proxy.stop(),
+            list(self._agents.values()) + self.agent_containers,
+            self.concurrency)
         if self.ctrl:
             await self.ctrl.stop()
         if self.obs:
             await self.obs.stop()
 
-        # Shutdown sub-processes
-        for p in self.container_procs:
-            await p.wait()
-            logger.debug('UnitAgent container process terminated')
+        # Shutdown sub-processes.  They all received their stop() above, so
+        # we can wait for them concurrently.
+        await asyncio.gather(*[p.wait() for p in self.container_procs])
+        await asyncio.gather(*self._output_tasks)
+        logger.debug('UnitAgent container processes terminated')
 
         await self.container.shutdown(as_coro=True)
         logger.debug('Controller / Observer container process terminated')
@@ -169,13 +195,20 @@ class MosaikAPI:
     @expose
     async def init(self, sid, *, start_date, n_agents, config):
         """Create a local agent container and the mosaik agent."""
+        # Import the agent modules only when they are needed
+        import controller.controller as controller
+        import observer.observer as observer
+
         self.sid = sid  # simulator id
+        self._aid_prefix = sid + '.'
         self.n_agents = n_agents  # number of required agents
         self.config = config
 
         # negotiation details
         # set step size
         self.step_size = config['Negotiation_details']['step_size']
+        # maximum number of concurrent requests
+        self.concurrency = config.get('concurrency', MAX_CONCURRENCY)
 
         # In-proc container for ControllerAgent / ObserverAgent
         addr = (self.host, self.port_start)
@@ -213,64 +246,65 @@ class MosaikAPI:
         eid_start = 'Agent'
         self._created_agents += num
         for i in range(n_agents, n_agents + num):
-            eid = eid_start + '%s' % i
+            eid = eid_start + str(i)
             entities.append({'eid': eid, 'type': model})
-            aid = '%s.%s' % (self.sid, eid)
+            aid = self._aid_prefix + eid
             self._aids.append(aid)
         return entities
 
     @expose
     async def setup_done(self):
         relations = await self.mosaik.get_related_entities(self._aids)
-        n_containers = len(self.agent_containers)
-        futs = []
-        for i, (aid, units) in enumerate(relations.items()):
-            # in debug mode, start all unit and planning agents in same
-            # container to achieve determinism in messages
-            if self.log_level == 'debug':
-                c = self.agent_containers[0]
-            else:
-                c = self.agent_containers[i % n_containers]
+        # in debug mode, start all unit and planning agents in same
+        # container to achieve determinism in messages
+        if self.log_level == 'debug':
+            containers = itertools.repeat(self.agent_containers[0])
+        else:
+            containers = itertools.cycle(self.agent_containers)
+        assignments = []
+        for (aid, units), c in zip(relations.items(), containers):
             assert len(units) == 1, 'Agent is connected to more than one unit.'
             uid, _ = units.popitem()
-            futs.append(self._spawn_ua(container=c, aid=aid, uid=uid))
+            assignments.append({'container': c, 'aid': aid, 'uid': uid})
+            self._uid_by_aid[aid] = uid
+            self._outputs[aid] = {uid: {'chosen_schedule': None}}
 
-        results = await asyncio.gather(*futs)
+        results = await util.gather_bounded(
+            lambda kwargs: self._spawn_ua(**kwargs), assignments,
+            self.concurrency)
         self._agents = {aid: agent for aid, agent in results}
         self._t_last_step = time.monotonic()
 
     @expose
     async def step(self, t, inputs):
-        # Update the time for the agents
+        # Update the time for the agents before they get new input, so that
+        # everything they do in this step happens at time *t*.
         await self._set_time(t)
-        # Prepare input data and forward it to the agents
-        data = {}
-        for eid, attrs in inputs.items():
-            input_data = {}
-            for attr, values in attrs.items():
-                assert len(values) == 1, 'Received Data from more than one unit'  # b/c we're only connected to 1 unit
-                sender_id, value = values.popitem()
-                input_data[attr] = value
-                data['%s.%s' % (self.sid, eid)] = input_data
+        # Prepare input data: each agent is connected to exactly one unit
+        # and only receives its 'possible_schedules' (a list of schedules
+        # as lists)
+        prefix = self._aid_prefix
+        possible_schedules = {
+            prefix + eid: next(iter(attrs['possible_schedules'].values()))
+            for eid, attrs in inputs.items()}
 
         # Update the unit agents with new possible schedules from mosaik.
-        # in data there should be a list with possible schedules as lists
-        futs = []
-        for aid, input_data in data.items():
-            # pass inputs to unitAgent
-            futs.append(self._agents[aid].set_possible_schedules(input_data['possible_schedules']))
-
-        await asyncio.gather(*futs)
+        agents = self._agents
+        await util.gather_bounded(
+            lambda aid: agents[aid].set_possible_schedules(possible_schedules[aid]),
+            possible_schedules, self.concurrency)
 
         # wait for registration of observer and agents
         await self.ctrl._agents_registered
         await self.ctrl._observer_registered
 
-        # read the target from .csv files
+        # read the target from .csv files.  The parsed file is cached until
+        # it changes.
         # This could also be adopted, such that the target comes from a simulator
         # or by getting different targets per day
-        target, weights = read_target_file(self.config['Negotiation_details']['target_file'],
-                                           resolution=self.resolution, intervals=self.intervals)
+        target, weights = read_target_file(
+            self.config['Negotiation_details']['target_file'],
+            resolution=self.resolution, intervals=self.intervals)
 
         # get startdate
         now = self.container.clock.utcnow()
@@ -292,12 +326,15 @@ class MosaikAPI:
 
         t_next = t + self.step_size
 
-        # create outputs (the chosen schedule_id) for connected simulators
-        futs = [a.get_current_schedule() for a in self._agents.values()]
-        schedules = await asyncio.gather(*futs)
-        outputs = {aid: {uid: {'chosen_schedule': schedule}}
-                   for aid, uid, schedule in schedules}
-        if outputs:
+        # create outputs (the chosen schedule_id) for connected simulators.
+        # The controller already knows the schedule of every agent, so we
+        # don't need to ask each agent for it.
+        schedules = self.ctrl.collect_schedules()
+        outputs = self._outputs
+        for aid, addr in self._addr_by_aid.items():
+            uid = self._uid_by_aid[aid]
+            outputs[aid][uid]['chosen_schedule'] = schedules[addr]
+        if self._addr_by_aid:
             await self.mosaik.set_data(outputs)
 
         return t_next
@@ -306,7 +343,7 @@ class MosaikAPI:
     async def get_data(self, outputs):
         data = {}
         for eid, attrs in outputs.items():
-            aid = '%s.%s' % (self.sid, eid)
+            aid = self._aid_prefix + eid
             if aid not in self._aids:
                 raise ValueError('Unknown entity ID "%s"' % eid)
             agent_instance = self._agents[aid]
@@ -322,22 +359,59 @@ class MosaikAPI:
         self.stopped.set_result(True)
 
     async def _start_containers(self, host, start_port, start_date, log_level, log_file):
+        # Resolve the executable only once for all subprocesses
+        executable = shutil.which('isaac-container') or 'isaac-container'
         addrs = []
-        procs = []
+        cmds = []
         for i in range(multiprocessing.cpu_count()):
             addr = (host, start_port + i)
             addrs.append('tcp://%s:%s/0' % addr)
-            cmd = ['isaac-container',
-                   '--start-date=%s' % start_date,
-                   '--log-level=%s' % log_level,
-                   '--log-file=%s' % log_file,
-                   '%s:%s' % addr]
-            procs.append(asyncio.ensure_future(asyncio.create_subprocess_exec(*cmd)))
-        procs = await asyncio.gather(*procs)
-        futs = [self.container.connect(a, timeout=10) for a in addrs]
-        containers = await asyncio.gather(*futs)
+            cmds.append([executable,
+                         '--start-date=%s' % start_date,
+                         '--log-level=%s' % log_level,
+                         '--log-file=%s' % log_file,
+                         '%s:%s' % addr])
+        procs = await util.gather_bounded(
+            lambda cmd: asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.PIPE),
+            cmds, self.concurrency)
+        # Only connect after all containers reported that they are ready
+        await util.gather_bounded(self._wait_ready, procs, self.concurrency)
+        containers = await util.gather_bounded(
+            lambda a: self.container.connect(a, timeout=10), addrs, self.concurrency)
         return containers, procs
 
+    async def _wait_ready(self, proc):
+        """Wait until the container process *proc* prints :data:`READY_MSG`
+        and forward its remaining output to our stdout.
+
+        Raise a :exc:`RuntimeError` if the container does not become ready
+        within :data:`READY_TIMEOUT` seconds.
+
+        """
+        try:
+            line = await asyncio.wait_for(proc.stdout.readline(),
+                                          READY_TIMEOUT)
+        except asyncio.TimeoutError:
+            proc.kill()
+            line = b''
+        if line.decode().strip() != READY_MSG:
+            raise RuntimeError('Agent container process %s failed to start'
+                               % proc.pid)
+        # Keep reading, so that the container never blocks on a full pipe
+        self._output_tasks.append(
+            aiomas.create_task(self._forward_output(proc.stdout)))
+
+    @staticmethod
+    async def _forward_output(stream):
+        """Copy all lines from *stream* to our stdout until it is closed."""
+        while True:
+            line = await stream.readline()
+            if not line:
+                break
+            sys.stdout.write(line.decode())
+            sys.stdout.flush()
+
     async def _spawn_ua(self, *, container, aid, uid):
         """Configure agents and connect simulated entities from mosaik with
         unit agents.
@@ -361,34 +435,47 @@ class MosaikAPI:
             unit_if=(unit_if_cls, {'agent_id': aid, 'unit_id': uid},),
             planner=(planner_cls, planner_config,),
         )
+        self._addr_by_aid[aid] = ua_addr
         return aid, unit_agent
 
     async def _set_time(self, time):
+        """Set the time of all containers to *time*."""
         self.container.clock.set_time(time)
-        futs = [c.set_time(time) for c in self.agent_containers]
-        await asyncio.gather(*futs)
+        await util.gather_bounded(
+            lambda c: c.set_time(time), self.agent_containers, self.concurrency)
 
 
 def read_target_file(path_to_target_file, resolution=900, intervals=96):
     """
     Read target file and return target and weights
+
+    Parsed files are cached until their modification time changes, so the
+    returned arrays are read-only.
     """
     assert os.path.isfile(path_to_target_file), 'Could not find target file: {}'.format(path_to_target_file)
+    mtime = os.path.getmtime(path_to_target_file)
+    return _read_target_file(path_to_target_file, mtime, resolution, intervals)
+
+
+@functools.lru_cache(maxsize=8)
+def _read_target_file(path_to_target_file, mtime, resolution, intervals):
+    """
+    Parse target file and return target and weights as read-only arrays.
+    *mtime* is only used as part of the cache key.
+    """
     # open the target file and read the header
-    my_open = lzma.open if path_to_target_file.endswith('.xz') else io.open
+    my_open = lzma.open if path_to_target_file.endswith('.xz') else open
     with my_open(path_to_target_file, 'rt') as target_file:
-        # assert that the length of the file corresponds with the no_intervals (minus 1 because of the json header)
-        no_rows = sum(1 for _ in target_file)
-        assert intervals == no_rows - 1
-        target_file.seek(0)  # jump back to beginning of file
         line = next(target_file).strip()
-        targets_meta = json.loads(line)  # get json header
+        targets_meta = json_lib.loads(line)  # get json header
         assert targets_meta['interval_minutes'] == resolution / 60
         # load the target schedule and weights
-        target = [0.0] * intervals
-        weight = [0.0] * intervals
-        for i in range(intervals):
-            data = next(target_file).strip().split(',')
-            target[i] = float(data[0])
-            weight[i] = float(data[1])
+        data = np.loadtxt(target_file, delimiter=',', dtype=np.float64,
+                          usecols=(0, 1), ndmin=2)
+    # assert that the length of the file corresponds with the no_intervals
+    assert data.shape[0] == intervals
+    target = data[:, 0]
+    weight = data[:, 1]
+    target.setflags(write=False)  # Make the cached arrays read-only
+    weight.setflags(write=False)
     return target, weight
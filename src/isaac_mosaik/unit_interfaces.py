@@ -2,7 +2,7 @@ import collections
 import asyncio
 
 from aiomas import expose
-import aiomas
+import numpy as np
 
 from unit import UnitInterface
 
@@ -11,7 +11,7 @@ STATE_BUFSIZE = 15  # We want to store that many state updates from our unit
 
 
 class MosaikInterface(UnitInterface):
-    router = aiomas.rpc.Service()
+    router = UnitInterface.router
 
     def __init__(self, agent, agent_id, unit_id):
         self._agent = agent
@@ -19,10 +19,15 @@ class MosaikInterface(UnitInterface):
         self._aid = agent_id
         self._uid = unit_id
         self._state = collections.deque(maxlen=STATE_BUFSIZE)
+        # Ring buffer with the numeric state updates.  The value buffer is
+        # allocated on the first update, when the shape of the data is known.
+        self._state_ts = np.zeros(STATE_BUFSIZE, dtype='datetime64[us]')
+        self._state_val = None
+        self._state_cnt = 0  # Number of numeric updates in the buffer
         self._schedule = None
         self._sid = None
         self._last_setpoint = None
-        self._received_new_schedule = asyncio.Future()
+        self._received_new_schedule = asyncio.Event()
         # Register the interface's router as subrouter of the agent:
         agent.router.set_sub_router(self.router, 'unit')
 
@@ -30,11 +35,44 @@ class MosaikInterface(UnitInterface):
     def state(self):
         return self._state
 
+    @property
+    def state_arrays(self):
+        """Tuple *(timestamps, values)* of NumPy arrays with the latest
+        numeric state updates in chronological order.
+
+        Only contains the updates since the last non-numeric update or change
+        of the data's shape.
+
+        """
+        n = min(self._state_cnt, STATE_BUFSIZE)
+        if n == 0:
+            return self._state_ts[:0], np.zeros(0)
+        # Index of the oldest entry
+        start = self._state_cnt % STATE_BUFSIZE if n == STATE_BUFSIZE else 0
+        order = (np.arange(n) + start) % STATE_BUFSIZE
+        return self._state_ts[order], self._state_val[order]
+
     @expose
     def update_state(self, data):
-        row = (self._utcnow(), data)
-        self._state.append(row)
-        
+        now = self._utcnow()
+        self._state.append((now, data))
+
+        try:
+            values = np.asarray(data)
+        except ValueError:  # Ragged sequences
+            values = None
+        if values is None or values.dtype.kind not in 'iuf':
+            # Not numeric, start over with the next numeric update
+            self._state_cnt = 0
+            return
+        if self._state_val is None or self._state_val.shape[1:] != values.shape:
+            self._state_val = np.zeros((STATE_BUFSIZE,) + values.shape)
+            self._state_cnt = 0
+        i = self._state_cnt % STATE_BUFSIZE
+        self._state_ts[i] = now.naive
+        self._state_val[i] = values
+        self._state_cnt += 1
+
     @expose
     def get_sid(self):
         return self._sid
@@ -50,19 +88,19 @@ class MosaikInterface(UnitInterface):
     # called by controller, so that unit knows that it expects a new schedule
     @expose
     def new_negotiation(self):
-        self._received_new_schedule = asyncio.Future()
+        self._received_new_schedule.clear()
 
     @expose
     def set_schedule(self, schedule_id):
         self._sid = schedule_id
         self._schedule = self._agent.model.get_schedule(schedule_id)
-        self._received_new_schedule.set_result(True)
+        self._received_new_schedule.set()
 
     @expose
     async def get_current_schedule(self):
         """Return a tuple (aid, uid, schedule_id)"""
         # wait until current negotiation is done
-        await self._received_new_schedule
+        await self._received_new_schedule.wait()
         if self._schedule is None:
             return None
         return self._aid, self._uid, self._sid
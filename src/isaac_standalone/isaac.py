@@ -1,13 +1,18 @@
 """Main process module of Smart Trading Service."""
 import asyncio
 
-from os.path import isfile
+import functools
+from os.path import getmtime, isfile
 import io
+import itertools
 import json
 import logging
+import logging.handlers
 import lzma
+import queue
 
 import aiomas
+import numpy as np
 
 import isaac_standalone.config as config
 import isaac_util.debug as debug
@@ -20,41 +25,65 @@ from observer.observer import ObserverAgent
 
 def main():
     """Open VPP multi-agent system."""
+    log_listener = None
     try:
+        util.setup_event_loop()
         # set log_level
         logging.getLogger('').setLevel('DEBUG')
-        # set file handler
-        logging.getLogger('').addHandler(util.get_log_file_handler('isaac_standalone.log'))
-        # set console handler
-        logging.getLogger('').addHandler(util.get_log_console_handler())
+        # Log records are only put into a queue in the event loop.  The file
+        # and console handlers write them in the listener's thread.
+        log_queue = queue.Queue()
+        logging.getLogger('').addHandler(
+            logging.handlers.QueueHandler(log_queue))
+        log_listener = logging.handlers.QueueListener(
+            log_queue,
+            util.get_log_file_handler('isaac_standalone.log'),  # file handler
+            util.get_log_console_handler(),  # console handler
+            respect_handler_level=True)
+        log_listener.start()
         print('[main] starting aiomas')
         aiomas.run(until=run())
     except KeyboardInterrupt:
         print('[main] Interrupting execution.')
     finally:
+        if log_listener is not None:
+            log_listener.stop()
         print('[main] Simulation done')
         
 
 def read_target_schedule(path_to_target_file, n_sim_steps=96):
     """
-    Read taget file and return target schedule and weights
+    Read taget file and return target schedule and weights as NumPy arrays
+
+    Parsed files are cached until their modification time changes, so the
+    returned arrays are read-only.
     """
     assert isfile(path_to_target_file)
-    # open the target file and read the header
+    mtime = getmtime(path_to_target_file)
+    return _read_target_schedule(path_to_target_file, mtime, n_sim_steps)
+
+
+@functools.lru_cache(maxsize=128)
+def _read_target_schedule(path_to_target_file, mtime, n_sim_steps):
+    """
+    Parse taget file and return target schedule and weights as read-only
+    arrays.  *mtime* is only used as part of the cache key.
+    """
+    # read (and decompress) the whole target file at once
     my_open = lzma.open if path_to_target_file.endswith('.xz') else io.open
-    target_file = my_open(path_to_target_file, 'rt')
-    line = next(target_file).strip()
-    targets_meta = json.loads(line)
+    with my_open(path_to_target_file, 'rb') as target_file:
+        lines = target_file.read().decode().splitlines()
+    # read the header
+    targets_meta = json.loads(lines[0])
     assert targets_meta['interval_minutes'] == 15
-
-    # create initial lists
-    target_schedule = [0.0] * n_sim_steps
-    weights = [1.0] * n_sim_steps
-    # load the target schedule
-    for i in range(n_sim_steps):
-        data = next(target_file).strip().split(',')
-        target_schedule[i] = float(data[0])
-        weights[i] = float(data[1])
+    # load the target schedule and weights
+    data = np.loadtxt(lines[1:n_sim_steps + 1], delimiter=',',
+                      dtype=np.float64, usecols=(0, 1), ndmin=2)
+    assert data.shape[0] == n_sim_steps
+    target_schedule = data[:, 0]
+    weights = data[:, 1]
+    target_schedule.setflags(write=False)  # Make the cached arrays read-only
+    weights.setflags(write=False)
     return target_schedule, weights
 
 
@@ -80,27 +109,28 @@ async def run():
     my_planner_cls = config.PLANNER_CLS
     my_planner_config = config.PLANNER_CONFIG
     
-    # create local container for controller and observer 
-    print('[run] Creating one container for Controller / Observer... ', end='')
-    host = config.CTRL_OBS_CONTAINER['host']
-    port = config.CTRL_OBS_CONTAINER['port']
-    container_1 = await aiomas.Container.create(
-        (host, port), codec=aiomas.MsgPack, clock=clock,
-        extra_serializers=util.get_extra_serializers(), as_coro=True)
-    print('Done!')
-    
-    # create local container for unitAgents
-    print('[run] Creating %s container for unitAgents... ' % len(config.AGENT_CONTAINER), end='')
+    # create local containers for controller / observer and for unitAgents
+    # concurrently.  The first one is used for controller and observer.
     container_config = config.AGENT_CONTAINER
     n_container = len(container_config)
-    agent_container = []
-    for i in range(n_container):
-        host = container_config[i]['host']
-        port = container_config[i]['port']
-        container = await aiomas.Container.create(
-            (host, port), codec=aiomas.MsgPack, clock=clock,
-            extra_serializers=util.get_extra_serializers(), as_coro=True)
-        agent_container.append(container)
+    print('[run] Creating one container for Controller / Observer and %s '
+          'container for unitAgents... ' % n_container, end='')
+    addrs = [(c['host'], c['port'])
+             for c in [config.CTRL_OBS_CONTAINER] + container_config]
+    extra_serializers = util.get_extra_serializers()
+    # compress the messages with blosc if it is installed
+    try:
+        import blosc  # noqa: F401
+    except ImportError:
+        codec = aiomas.MsgPack
+    else:
+        codec = aiomas.MsgPackBlosc
+    containers = await asyncio.gather(*[
+        aiomas.Container.create(
+            addr, codec=codec, clock=clock,
+            extra_serializers=extra_serializers, as_coro=True)
+        for addr in addrs])
+    container_1, agent_container = containers[0], containers[1:]
     print('Done!')
     
     # instantiate controller / observer
@@ -115,43 +145,50 @@ async def run():
 
     # instantiate UnitAgents
     print('[run] Initializing UnitAgents.')
-
-    for i in range(config.N_AGENTS):
-        # get details from general_unit_model_config set in config
-        agents_unit_model_config = {key: value for key, value in general_unit_model_config.items()}
-        # add details from GENERAL_AGENT_DETAILS provided in config
-        for key, value in config.GENERAL_AGENT_DETAILS.items():
-            agents_unit_model_config[key] = value
-
+    # details from general_unit_model_config and GENERAL_AGENT_DETAILS set
+    # in config are the same for all agents
+    base_unit_model_config = dict(general_unit_model_config,
+                                  **config.GENERAL_AGENT_DETAILS)
+    specs = {container: [] for container in agent_container}
+    # agents are distributed round-robin over the agent containers
+    containers = itertools.cycle(agent_container)
+    for i, container in zip(range(config.N_AGENTS), containers):
+        agents_unit_model_config = base_unit_model_config.copy()
         # details for current agent are provided in config
         if i < len(config.SPECIFIC_AGENT_DETAILS):
             agent_details = config.SPECIFIC_AGENT_DETAILS[i]
-            # pop unit name from dict first
-            unit_name = agent_details.pop('name', None)
+            # the unit name is not passed to the unit model
+            unit_name = agent_details.get('name')
             # so far, all other details have to be passed to the unit model
-            for key, value in agent_details.items():
-                agents_unit_model_config[key] = value
+            agents_unit_model_config.update(
+                (k, v) for k, v in agent_details.items() if k != 'name')
         else:
             unit_name = None
 
         # make sure non-optional kwargs are provided
-        assert 'get_schedules_from_files' in agents_unit_model_config.keys(),\
+        assert 'get_schedules_from_files' in agents_unit_model_config,\
             'Non optional kwarg \'get_schedules_from_files\' is not provided for Agent {}'.format(str(i))
         if agents_unit_model_config['get_schedules_from_files']:
-            assert 'schedule_dir' in agents_unit_model_config.keys(), \
+            assert 'schedule_dir' in agents_unit_model_config, \
                 'No schedule directory specified for Agent {}'.format(str(i))
 
-        # create uni_agent
-        unit_agent = await UnitAgent.factory(
-            agent_container[i % n_container],
+        # spec for creating the unit_agent
+        specs[container].append({
+            'unit_model': (my_unit_model_cls, agents_unit_model_config),
+            'unit_if': None,
+            'planner': (my_planner_cls, my_planner_config),
+            'unit_name': unit_name,
+        })
+    # create all unit_agents of a container at once
+    UnitAgent.preresolve([(my_unit_model_cls, None),
+                          (my_planner_cls, None)])
+    await asyncio.gather(*[
+        UnitAgent.factory_many(
+            container,
             ctrl_agent_addr=ctrl.addr,
             obs_agent_addr=obs.addr,
-            unit_model=(my_unit_model_cls, agents_unit_model_config),
-            unit_if=None,
-            planner=(my_planner_cls, my_planner_config),
-            unit_name=unit_name
-        )
-        del unit_agent
+            specs=container_specs)
+        for container, container_specs in specs.items() if container_specs])
 
     # run agents and services until manually cancelled or stop time is reached
     try:
@@ -180,7 +217,7 @@ async def run():
     finally:
         # gracefully cancel async processes
         print('[run] Stopping planner tasks if still running... ', end='')
-        futs = [a.stop() for a in ctrl._agents.keys()]
+        futs = [a.stop() for a in ctrl._agents]
         await asyncio.gather(*futs)
         print('Done!')
         
@@ -7,6 +7,10 @@ import arrow
 import asyncio
 
 
+# Minimum wall-clock time in seconds between two updates of the clock
+MIN_TICK = 0.1
+
+
 class DebuggingClock(aiomas.ExternalClock):
     """Simple external clock for debugging."""
 
@@ -18,18 +22,27 @@ class DebuggingClock(aiomas.ExternalClock):
         """
         super().__init__(start)
         self._stop = arrow.get(stop).to('utc')
+        # Stop date as clock time, so that we don't need to compare dates
+        self._stop_time = (self._stop - self._utc_start).total_seconds()
         # speed_up must be positive, non-zero
         assert speed_up > 0.0
         self._speed_up = speed_up
 
     async def run(self):
-        """Let time pass *speed_up* times as fast as real-time."""
+        """Let time pass *speed_up* times as fast as real-time.
+
+        The clock advances by 60 seconds every ``1 / speed_up`` seconds.  For
+        large *speed_up* factors, several of these steps are done at once, so
+        that the clock is updated at most every :data:`MIN_TICK` seconds.
+        """
+        tick_wall = max(1 / self._speed_up, MIN_TICK)
+        tick_sim = 60 * self._speed_up * tick_wall
         finished = False
         while not finished:
             try:
-                await asyncio.sleep(1 / self._speed_up)
-                self.set_time(self.time() + 60)
-                finished = self.utcnow() > self._stop
+                await asyncio.sleep(tick_wall)
+                self.set_time(self.time() + tick_sim)
+                finished = self.time() > self._stop_time
             except asyncio.CancelledError:
                 print('Stopping debugging clock...')
                 finished = True
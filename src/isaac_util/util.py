@@ -1,13 +1,32 @@
+import asyncio
 import click
 import functools
 import itertools
 import logging
+import sys
 
 import numpy as np
 import aiomas.codecs
 import arrow
 
 
+def setup_event_loop():
+    """Use the Proactor event loop on Windows and uvloop (if it is installed)
+    on all other platforms.
+
+    """
+    if sys.platform == 'win64' or sys.platform == 'win32':
+        loop = asyncio.ProactorEventLoop()
+        asyncio.set_event_loop(loop)
+    else:
+        try:
+            import uvloop
+        except ImportError:
+            pass
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
 def get_container_kwargs(start_date):
     return {
         'clock': aiomas.ExternalClock(start_date, init_time=-1),
@@ -48,6 +67,26 @@ def get_extra_serializers():
     ]
 
 
+async def gather_bounded(func, iterable, limit):
+    """Call *func* for each item in *iterable* and await all results, but
+    keep at most *limit* of these calls pending at the same time.
+
+    *func* must return an awaitable (e.g., a coroutine or the future returned
+    by an RPC proxy).  It is not called before a slot is free, so the number
+    of concurrently running requests is bounded.  Like
+    :func:`asyncio.gather()`, return the list of results in the order of
+    *iterable*.
+
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def call(item):
+        async with semaphore:
+            return await func(item)
+
+    return await asyncio.gather(*[call(item) for item in iterable])
+
+
 def check_date_diff(date, base_date, res):
     """Assert that *date* >= *base_date* and that both dates are aligned with
     a resolution of *res* seconds.
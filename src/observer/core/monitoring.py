@@ -1,10 +1,47 @@
-from asyncio import coroutine
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
 import h5py
 
 import numpy as np
 
 
+# Data types of the data sets that are written for each negotiation
+TS_DTYPE = np.dtype([
+    ('target schedule', 'float64'),
+    ('weights', 'float64'),
+])
+AGENT_DTYPE = np.dtype([
+    ('Name', 'S100'),
+    ('Address', 'S100'),
+    ('Index in cs', 'int'),
+    ('Internal Schedule ID', 'int'),
+])
+TOPOLOGY_DTYPE = np.dtype([
+    ('agent 1', 'S100'),
+    ('agent 2', 'S100'),
+])
+DAP_DTYPE = np.dtype([
+    ('t', 'float64'),
+    ('agent', 'S100'),
+    ('perf', 'float64'),
+    ('complete', bool),
+    ('msgs_out', 'uint64'),
+    ('msgs_in', 'uint64'),
+    ('msg_sent', bool),
+])
+
+# Number of DAP rows that are buffered before they are written to the database
+BATCH_SIZE = 1024
+
+# Compression of the large data sets.  LZF is fast enough for the DAP data
+# that is written during a negotiation, the cluster schedules are written
+# once per negotiation and compress better with gzip.
+DAP_COMPRESSION = {'compression': 'lzf', 'shuffle': True}
+CS_COMPRESSION = {'compression': 'gzip', 'compression_opts': 4,
+                  'shuffle': True}
+
+
 class Monitoring:
     """Database for the storage of all agent and negotiation related
     data in the system.
@@ -18,7 +55,16 @@ class Monitoring:
         self._topgroup = None
         self._agent_addresses = {}
         self._agent_names = {}
-        self._dap_data = []
+        # DAP rows are collected in a buffer which is appended to the
+        # resizable "dap_data" data set of the current negotiation when full.
+        self._dap_buf = np.empty(BATCH_SIZE, dtype=DAP_DTYPE)
+        self._dap_buf_i = 0
+        self._dap_ds = None
+        self._agent_bytes = {}  # Cache for encoded agent addresses
+        self._name_bytes = {}  # Cache for encoded agent names
+        # The data of a negotiation is written in a separate thread, so that
+        # the event loop is not blocked by flush().
+        self._writer = ThreadPoolExecutor(max_workers=1)
 
     def setup(self, date, agent_addresses, agent_names):
         """Setup monitoring for a new run / negotiation.
@@ -30,14 +76,20 @@ class Monitoring:
         """
         self._agent_addresses = agent_addresses
         self._agent_names = agent_names
-        self._dap_data = []
+        self._agent_bytes.update((addr, addr.encode())
+                                 for addr in agent_addresses.values())
+        self._name_bytes.update((name, name.encode())
+                                for name in agent_names.values())
+        self._dap_buf_i = 0
 
         group_name = date.format('YYYYMMDD')
         db_group = self._db['/dap'].create_group(group_name)
         self._topgroup = db_group
+        self._dap_ds = db_group.create_dataset(
+            'dap_data', shape=(0,), maxshape=(None,), chunks=(BATCH_SIZE,),
+            dtype=DAP_DTYPE, **DAP_COMPRESSION)
 
-    @coroutine
-    def flush(self, target_schedule, weights, solution):
+    async def flush(self, target_schedule, weights, solution):
         """Writes *target_schedule*, *weights*, *solution* and collected
         negotation data to hdf5 database.
 
@@ -49,43 +101,51 @@ class Monitoring:
         :param solution: Cluster schedule as
         :class:`openvpp_agents.planning.Candidate`
         """
-        dap_data, self._dap_data = self._dap_data, []
-
         # Extract DAP data to be stored
         db_group = self._topgroup
-        target_weight_data = [tuple(i) for i in zip(target_schedule, weights)]
-        dtype = np.dtype([
-            ('target schedule', 'float64'),
-            ('weights', 'float64')
-        ])
-        target_weight_data = np.array(target_weight_data, dtype=dtype)
-        db_group.create_dataset('ts', data=target_weight_data)
-        db_group.create_dataset('cs', data=solution.cs)
-
-        agent_details = [''] * len(solution.idx)
-        for agent_addr, index in solution.idx.items():
-            agent_details[index] = (self._agent_names[agent_addr].encode(), agent_addr.encode(), index, solution.sids[index])
-        dtype = np.dtype([
-            ('Name', 'S100'),
-            ('Address', 'S100'),
-            ('Index in cs', 'int'),
-            ('Internal Schedule ID', 'int')
-        ])
-        agent_data = np.array(agent_details, dtype=dtype)
-        db_group.create_dataset('Agent details', data=agent_data)
-
-        self._store_data(db_group, dap_data)
-        self._db.flush()
+        target_weight_data = np.empty(len(target_schedule), dtype=TS_DTYPE)
+        target_weight_data['target schedule'] = target_schedule
+        target_weight_data['weights'] = weights
+
+        # Agent addresses ordered by their index in the cluster schedule
+        agent_addrs = sorted(solution.idx, key=solution.idx.get)
+        agent_data = np.empty(len(agent_addrs), dtype=AGENT_DTYPE)
+        agent_data['Name'] = [self._encode_name(self._agent_names[a])
+                              for a in agent_addrs]
+        agent_data['Address'] = [self._encode_agent(a) for a in agent_addrs]
+        agent_data['Index in cs'] = [solution.idx[a] for a in agent_addrs]
+        agent_data['Internal Schedule ID'] = solution.sids
+
+        datasets = [
+            ('ts', target_weight_data, {}),
+            ('cs', solution.cs, CS_COMPRESSION if solution.cs.size else {}),
+            ('Agent details', agent_data, {}),
+        ]
+        dap_ds, self._dap_ds = self._dap_ds, None  # Drop later rows
+        dap_rows = self._dap_buf[:self._dap_buf_i].copy()
+        self._dap_buf_i = 0
+
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self._writer, self._write, db_group,
+                                   datasets, dap_ds, dap_rows)
 
     def close(self):
-        """Close the database."""
+        """Wait for pending writes and close the database."""
+        self._writer.shutdown(wait=True)
         self._db.close()
 
     def append(self, row):
         """Store *row* in Database, but do not flush - this is done in
         either :meth:stop or :meth:flush_collected_data
         """
-        self._dap_data.append(row)
+        if self._dap_ds is None:
+            return  # No negotiation is being monitored
+        t, agent, perf, complete, mo, mi, ms = row
+        self._dap_buf[self._dap_buf_i] = (t, self._encode_agent(agent), perf,
+                                          complete, mo, mi, ms)
+        self._dap_buf_i += 1
+        if self._dap_buf_i == BATCH_SIZE:
+            self._drain()
 
     def store_topology(self, connections):
         """Write topology between unit agents specified by *connections*
@@ -97,27 +157,53 @@ class Monitoring:
         """
         assert self._topgroup
         # create encoded data set
-        dtype = np.dtype([
-            ('agent 1', 'S100'),
-            ('agent 2', 'S100'),
-        ])
-        conn_data = np.array([(a.encode(), b.encode())
-                         for a, b in connections], dtype = dtype)
+        conn_data = np.empty(len(connections), dtype=TOPOLOGY_DTYPE)
+        if connections:
+            agents_1, agents_2 = zip(*connections)
+            conn_data['agent 1'] = [self._encode_name(a) for a in agents_1]
+            conn_data['agent 2'] = [self._encode_name(a) for a in agents_2]
         # store data in group
         self._topgroup.create_dataset('topology', data=conn_data)
 
-    def _store_data(self, group, dap_data):
-        
-        dtype = np.dtype([
-            ('t', 'float64'),
-            ('agent', 'S100'),
-            ('perf', 'float64'),
-            ('complete', bool),
-            ('msgs_out', 'uint64'),
-            ('msgs_in', 'uint64'),
-            ('msg_sent', bool),
-        ])
-        dap_data = [(t, a.encode(), perf, complete, mo, mi, ms)
-                    for t, a, perf, complete, mo, mi, ms in dap_data]
-        dap_data = np.array(dap_data, dtype=dtype)
-        group.create_dataset('dap_data', data=dap_data)
+    def _encode_agent(self, agent):
+        """Return the encoded address of *agent*."""
+        agent_bytes = self._agent_bytes.get(agent)
+        if agent_bytes is None:
+            agent_bytes = self._agent_bytes[agent] = agent.encode()
+        return agent_bytes
+
+    def _encode_name(self, name):
+        """Return the encoded agent *name*."""
+        name_bytes = self._name_bytes.get(name)
+        if name_bytes is None:
+            name_bytes = self._name_bytes[name] = name.encode()
+        return name_bytes
+
+    def _drain(self):
+        """Append the buffered DAP rows to the "dap_data" data set."""
+        n = self._dap_buf_i
+        if n == 0:
+            return
+        self._append_rows(self._dap_ds, self._dap_buf[:n])
+        self._dap_buf_i = 0
+
+    def _write(self, group, datasets, dap_ds, dap_rows):
+        """Create the data sets *datasets* (a list of *(name, data, kwargs)*
+        tuples) in *group*, append *dap_rows* to *dap_ds* and flush the
+        database.
+
+        Called in the writer thread.
+        """
+        for name, data, kwargs in datasets:
+            group.create_dataset(name, data=data, **kwargs)
+        self._append_rows(dap_ds, dap_rows)
+        self._db.flush()
+
+    @staticmethod
+    def _append_rows(ds, rows):
+        """Append *rows* to the resizable data set *ds*."""
+        if len(rows) == 0:
+            return
+        size = ds.shape[0]
+        ds.resize((size + len(rows),))
+        ds[size:] = rows
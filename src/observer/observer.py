@@ -46,6 +46,7 @@ class ObserverAgent(aiomas.Agent):
         self._n_agents = n_agents   # number of unitAgents
         self._ctrl = ctrl_proxy     # controller
         self._agents_registered = asyncio.Future()  # are all agents registered?
+        self._n_pending = n_agents or 0  # agents that still have to register
         if n_agents is None:
             self._agents_registered.set_result(True)
             
@@ -72,6 +73,7 @@ class ObserverAgent(aiomas.Agent):
         self._solution_determined = asyncio.Future()
         self._solution = None
         self._candidates = []
+        self._merge_candidates = None  # set in start_observation()
         self._task_finish_neg = None
 
         self._stop = False
@@ -107,12 +109,28 @@ class ObserverAgent(aiomas.Agent):
 
         """
         logger.debug('[ObserverAgent] unitAgent registered: %s', addr)
+        new = agent_proxy not in self._agents
         self._agents[agent_proxy] = addr
         self._agent_names[addr] = name if name else addr
         # check if all agents have registered
-        if self._n_agents is not None and len(self._agents) == self._n_agents:
-            self._agents_registered.set_result(True)
+        if new and self._n_pending:
+            self._n_pending -= 1
+            if self._n_pending == 0:
+                self._agents_registered.set_result(True)
         
+    @expose
+    def register_unitAgents(self, agents):
+        """Register a batch of unit agents.
+
+        Called by unit agents during startup instead of
+        :meth:`register_unitAgent()` for each single agent.
+
+        :param agents: List of *(agent_proxy, addr, name)* tuples.
+
+        """
+        for agent_proxy, addr, name in agents:
+            self.register_unitAgent(agent_proxy, addr, name)
+
     @expose
     def start_observation(self, conn_data, date, target_schedule, weights):
         """Initiate the observer's task of observing a negotiation.
@@ -132,6 +150,18 @@ class ObserverAgent(aiomas.Agent):
         assert len(target_schedule) == len(weights)
         self._ts = target_schedule
         self._weights = weights
+        # Reducer for merging the final candidates in case the negotiation
+        # does not terminate.  We need a dummy WorkingMemory for this:
+        wm = planning.WorkingMemory(
+            neighbors=None,
+            start=None, res=None, intervals=None,
+            ts=self._ts,
+            weights=self._weights,
+            ps=None,
+            sysconf=None, candidate=None)
+        self._merge_candidates = functools.partial(
+            planning.Candidate.merge, agent='controller',
+            perf_func=wm.objective_function)
 
         self._termination_detector.reset()
         self._reset_negotiation_setup()
@@ -155,6 +185,10 @@ class ObserverAgent(aiomas.Agent):
         the number of the operation schedule chosen by the agent and the
         numbers of messages received, sent and outgoing.
 
+        Updates are not batched: the termination detection must see every
+        update as soon as possible, and unit agents wait for this call
+        before they continue.
+
         :param agent: The unit agent's name.
         :param t: Date of sending.
         :param perf: Current performance measured at the unit agent.
@@ -195,18 +229,7 @@ class ObserverAgent(aiomas.Agent):
             self._solution = solution
         else:
             # Merge all candidates into a single solution.
-            # We need a dummy WorkingMemory for this:
-            wm = planning.WorkingMemory(
-                neighbors=None,
-                start=None, res=None, intervals=None,
-                ts=self._ts,
-                weights=self._weights,
-                ps=None,
-                sysconf=None, candidate=None)
-            reducer = functools.partial(planning.Candidate.merge,
-                                        agent='controller',
-                                        perf_func=wm.objective_function)
-            solution = functools.reduce(reducer, candidates)
+            solution = functools.reduce(self._merge_candidates, candidates)
             self._solution = solution
         self._solution_determined.set_result(True)
         return solution
@@ -13,11 +13,61 @@ import logging
 import numpy as np
 import time
 
+try:
+    from numba import njit  # compiles the objective function, if available
+except ImportError:
+    njit = None
+
 import unit
 
 logger = logging.getLogger(__name__)
 
 
+def _weighted_deviation(ts, sum_cs, weights):
+    """Return the sum of the deviations of *sum_cs* from the target schedule
+    *ts*, weighted by *weights*."""
+    diff = np.abs(ts - sum_cs)  # deviation to the target schedeule
+    w_diff = diff * weights  # multiply with weight vector
+    return np.sum(w_diff)
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _weighted_deviation(ts, sum_cs, weights):
+        # Same as above, but in a single pass without temporary arrays
+        result = 0.0
+        for j in range(ts.shape[0]):
+            result += abs(ts[j] - sum_cs[j]) * weights[j]
+        return result
+
+
+def _merge_sorted(agents_i, agents_j):
+    """Merge the two sorted sequences of agent names *agents_i* and
+    *agents_j* in a single pass.
+
+    Return a tuple *(merged, n_common)*: *merged* is the sorted list of
+    *(agent, in_i)* tuples for all agents, where *in_i* tells if the agent is
+    in *agents_i*.  *n_common* is the number of agents in both sequences.
+    """
+    merged = []
+    n_i, n_j = len(agents_i), len(agents_j)
+    i = j = 0
+    while i < n_i and j < n_j:
+        if agents_i[i] < agents_j[j]:
+            merged.append((agents_i[i], True))
+            i += 1
+        elif agents_i[i] > agents_j[j]:
+            merged.append((agents_j[j], False))
+            j += 1
+        else:
+            merged.append((agents_i[i], True))
+            i += 1
+            j += 1
+    merged.extend((a, True) for a in agents_i[i:])
+    merged.extend((a, False) for a in agents_j[j:])
+    return merged, n_i + n_j - len(merged)
+
+
 class Planner(unit.Planner):
     """ Planning instance that is used to manage the negotiations.
     It belongs to a specific UnitAgent *agent* """
@@ -31,6 +81,7 @@ class Planner(unit.Planner):
         self.task_negotiation = None        # Task for negotiation
         self.task_negotiation_stop = False  # Is True if negotiation should stop
         self.inbox = []                     # Inbox of messages
+        self.inbox_event = asyncio.Event()  # Set if inbox or stop changed
         self.wm = None                      # Working memory
 
     def stop(self):
@@ -92,12 +143,9 @@ class Planner(unit.Planner):
         Initialize negotiation by sending initial sysconf and candidate to all
         neighbors
         """
-        for neighbor in self.wm.neighbors:
-            self.wm.msgs_out += 1
-            logger.debug('%s sending message %d' % (self.agent.name, self.wm.msgs_out))
-            aiomas.create_task(neighbor.update(self.wm.sysconf, self.wm.candidate))
+        broadcast = self._act()
         logger.debug('%s updating Observer from init_negotiation' % self.agent.name)
-        await self._update_obs_agent(True)
+        await asyncio.gather(broadcast, self._update_obs_agent(True))
         
     @aiomas.expose
     async def stop_negotiation(self):
@@ -107,6 +155,7 @@ class Planner(unit.Planner):
         """
         # send signal to negotiation task
         self.task_negotiation_stop = True
+        self.inbox_event.set()
         # wait for task to finish
         await self.task_negotiation
         
@@ -122,8 +171,11 @@ class Planner(unit.Planner):
     async def process_inbox(self):
         """Process inbox."""
         while not self.task_negotiation_stop:
-            # wait for some time
+            # wait for new messages (or the stop signal) and then some time
+            # to collect further messages
+            await self.inbox_event.wait()
             await asyncio.sleep(self.check_inbox_interval)
+            self.inbox_event.clear()
 
             if not self.inbox:  # Inbox is empty
                 continue
@@ -154,10 +206,12 @@ class Planner(unit.Planner):
                 wm.sysconf = sc
                 wm.candidate = cand
 
-                # broadcast new sysconf and candidate
-                self._act()
-            
-            await self._update_obs_agent(state_changed)
+                # broadcast new sysconf and candidate and wait until they
+                # (and the observer) received them
+                await asyncio.gather(self._act(),
+                                     self._update_obs_agent(True))
+            else:
+                await self._update_obs_agent(False)
 
     def _perceive(self, sysconf, sysconf_other, candidate, candidate_other):
         """Merge the system configuration and candidates from *self* and
@@ -180,24 +234,29 @@ class Planner(unit.Planner):
         Return ``None`` if we don't find any.
 
         """
-        best_perf = current_best_perf
-        new_op_sched = None
-        new_sid = None
-        new_candidate_found = False
-        for sid, _, op_sched in self.wm.ps:  # utility can be ignored
-            # Currently, we use the "global" check here, but this might change
-            # so don't return the candidate directly.
-            new_s = sysconf.update(name, op_sched, sid)
-            new_perf = self.wm.objective_function(new_s.cs)
-            if new_perf > best_perf:
-                # new_c performs better than all others before
-                new_candidate_found = True
-                best_perf = new_perf
-                new_op_sched = op_sched
-                new_sid = sid
-
-        # return *new_op_sched* with sid *new_sid* if we found a better candidate
-        if new_candidate_found:
+        wm = self.wm
+        # Sum the cluster schedule for all possible schedules at once: our
+        # os is replaced with each possible schedule (one per row).  The rows
+        # are added in the same order as in cs.sum(axis=0), so the
+        # performances are the same as from wm.objective_function().
+        # Currently, we use the "global" check here, but this might change
+        # so don't return the candidate directly.
+        cs = sysconf.cs
+        i = sysconf.idx[name]
+        sum_cs = np.zeros_like(wm.ps_matrix)
+        for k in range(len(cs)):
+            sum_cs += wm.ps_matrix if k == i else cs[k]
+        ts, weights = wm.ts, wm.weights
+        perfs = np.array([-_weighted_deviation(ts, s, weights)
+                          for s in sum_cs])
+
+        # The first of the best performing schedules wins
+        best = perfs.argmax()
+        if perfs[best] > current_best_perf:
+            # return *new_op_sched* with sid *new_sid* if we found a better
+            # candidate
+            # utility can be ignored
+            new_sid, _, new_op_sched = wm.ps[wm.ps_index[best]]
             return new_op_sched, new_sid
         else:
             return None
@@ -207,14 +266,20 @@ class Planner(unit.Planner):
         """Update agent."""
         logger.debug('%s received message.' % self.agent.name)
         self.inbox.append((sysconf_other, candidate_other))
+        self.inbox_event.set()
 
     def _act(self):
-        """Broadcast new sysconf and candidate to all neighbors."""
+        """Broadcast new sysconf and candidate to all neighbors.
+
+        Return a future that is done when all neighbors received them.
+        """
         wm = self.wm
+        futs = []
         for neighbor in wm.neighbors:
             wm.msgs_out += 1
             logger.debug('%s sending message %d' % (self.agent.name, wm.msgs_out))
-            aiomas.create_task(neighbor.update(wm.sysconf, wm.candidate))
+            futs.append(neighbor.update(wm.sysconf, wm.candidate))
+        return asyncio.gather(*futs)
 
     def _decide(self, sysconf, candidate):
         """
@@ -239,21 +304,33 @@ class Planner(unit.Planner):
             # new_os_sid is actually a tuple of (*os*, *sid*)!
             new_os, new_sid = new_os_sid
 
-            new_s = sysconf.update(name, new_os, new_sid)
-            new_candidate = Candidate(
-                agent=self.name,
-                idx=new_s.idx,
-                cs=new_s.cs,
-                sids=new_s.sids, perf=None).update(
-                name, new_os, new_sid,
-                self.wm.objective_function
-            )
-
-            if new_candidate.perf > candidate.perf:
+            # Only build the cluster schedule of the new candidate for now.
+            # A new sysconf is only needed if the candidate gets accepted.
+            i = sysconf.idx[name]
+            cs = sysconf.cs.copy()
+            cs[i] = new_os
+            new_perf = self.wm.objective_function(cs)
+
+            if new_perf > candidate.perf:
                 # We found a new candidate
-                candidate = new_candidate
+                sids = sysconf.sids.copy()
+                sids[i] = new_sid
+                candidate = Candidate(
+                    agent=self.name,
+                    idx=dict(sysconf.idx),
+                    cs=cs,
+                    sids=sids.tolist(),
+                    perf=new_perf)
                 best_os = new_os
                 best_sid = new_sid
+                if current_sid != best_sid:
+                    # The new sysconf shares the (read-only) cluster schedule
+                    # with the new candidate, so we don't need to copy it.
+                    cnt = sysconf.cnt.copy()
+                    cnt[i] += 1
+                    sysconf = SystemConfig(idx=dict(sysconf.idx), cs=cs,
+                                           sids=sids, cnt=cnt)
+                    return sysconf, candidate
 
         if current_sid != best_sid:
             # We need a new counter value if
@@ -290,19 +367,23 @@ class Planner(unit.Planner):
 class SystemConfig:
     """Immutable data structure that holds the system configuration."""
     Data = namedtuple('Data', 'os, sid, count')
+    __slots__ = ('_idx', '_cs', '_sids', '_cnt', '_agents')
 
     def __init__(self, idx, cs, sids, cnt):
         self._idx = idx
         self._cs = cs
         self._cs.setflags(write=False)  # Make the NumPy array read-only
-        self._sids = tuple(sids)
-        self._cnt = tuple(cnt)
+        self._sids = np.asarray(sids, dtype=np.int64)
+        self._sids.setflags(write=False)
+        self._cnt = np.asarray(cnt, dtype=np.int64)
+        self._cnt.setflags(write=False)
+        self._agents = None  # Lazily computed agent names in row order
 
     def __eq__(self, other):
         return (
             self._idx == other._idx and
-            self._sids == other._sids and
-            self._cnt == other._cnt and
+            np.array_equal(self._sids, other._sids) and
+            np.array_equal(self._cnt, other._cnt) and
             np.array_equal(self._cs, other._cs)
         )
 
@@ -320,14 +401,27 @@ class SystemConfig:
 
     @property
     def sids(self):
-        """List of schedule IDs for each OS in the cluster schedule."""
+        """Schedule IDs for each OS in the cluster schedule as NumPy array."""
         return self._sids
 
     @property
     def cnt(self):
-        """Counter values for each OS selection in the cluster schedule."""
+        """Counter values for each OS selection in the cluster schedule as
+        NumPy array."""
         return self._cnt
 
+    @property
+    def agents(self):
+        """Agent names as NumPy array, ordered like the rows of the cluster
+        schedule (computed on first access)."""
+        if self._agents is None:
+            agents = [None] * len(self._idx)
+            for agent, i in self._idx.items():
+                agents[i] = agent
+            self._agents = np.array(agents)
+            self._agents.setflags(write=False)
+        return self._agents
+
     @classmethod
     def merge(cls, sysconf_i, sysconf_j):
         """Merge *sysconf_i* and *sysconf_j* and return the result.
@@ -336,40 +430,36 @@ class SystemConfig:
         the original instance of *sysconf_i* (unchanged).
 
         """
-        modified = False
-        keyset_i = set(sysconf_i.idx)
-        keyset_j = set(sysconf_j.idx)
-
-        idx_map = {}    # map with indices for each agent
-        cs = []         # clustered schedule (list of *os)
-        sids = []       # list of schedule ids
-        cnt = []        # list of counter values
+        agents_i = sysconf_i.agents
+        agents_j = sysconf_j.agents
 
         # Keep agents sorted to that all agents build the same index map
-        for i, a in enumerate(sorted(keyset_i | keyset_j)):
-            os = None
-            count = -1
-
-            # An a might be in keyset_i, keyset_j or in both!
-            if a in keyset_i:
-                # Use data of this a if it exists
-                os, sid, count = sysconf_i.data(a)
-            if a in keyset_j:
-                # Use data of other a if it exists ...
-                data_j = sysconf_j.data(a)
-                if data_j.count > count:
-                    # ... and if it is newer:
-                    modified = True
-                    os, sid, count = data_j
-
-            idx_map[a] = i
-            cs.append(os)
-            sids.append(sid)
-            cnt.append(count)
+        agents = np.union1d(agents_i, agents_j)
+        rows_i = np.searchsorted(agents, agents_i)
+        rows_j = np.searchsorted(agents, agents_j)
+
+        # Start with the data of sysconf_i.  Agents only known by sysconf_j
+        # get a count of -1, so that their data in sysconf_j is always newer.
+        n_agents = len(agents)
+        cs = np.empty((n_agents, sysconf_i.cs.shape[1]),
+                      dtype=sysconf_i.cs.dtype)
+        sids = np.zeros(n_agents, dtype=np.int64)
+        cnt = np.full(n_agents, -1, dtype=np.int64)
+        cs[rows_i] = sysconf_i.cs
+        sids[rows_i] = sysconf_i.sids
+        cnt[rows_i] = sysconf_i.cnt
+
+        # Use data of sysconf_j for each agent where it is newer
+        newer = sysconf_j.cnt > cnt[rows_j]
 
         # return new instance if sysconf_i has been modified
-        if modified:
-            sysconf = cls(idx=idx_map, cs=np.array(cs), sids=sids, cnt=cnt)
+        if newer.any():
+            rows = rows_j[newer]
+            cs[rows] = sysconf_j.cs[newer]
+            sids[rows] = sysconf_j.sids[newer]
+            cnt[rows] = sysconf_j.cnt[newer]
+            idx_map = {a: i for i, a in enumerate(agents.tolist())}
+            sysconf = cls(idx=idx_map, cs=cs, sids=sids, cnt=cnt)
 
         # return original instance, if it remains unchanged
         else:
@@ -385,8 +475,8 @@ class SystemConfig:
         """Return a tuple *(os, sid, count)* for *agent*."""
         idx = self._idx[agent]
         os = self._cs[idx]
-        sid = self._sids[idx]
-        count = self._cnt[idx]
+        sid = int(self._sids[idx])
+        count = int(self._cnt[idx])
         return self.Data(os, sid, count)
 
     def update(self, agent, os, sid):
@@ -397,9 +487,9 @@ class SystemConfig:
         i = idx[agent]
         cs = self._cs.copy()
         cs[i] = os
-        sids = list(self._sids)
+        sids = self._sids.copy()
         sids[i] = sid
-        cnt = list(self._cnt)
+        cnt = self._cnt.copy()
         cnt[i] += 1
         return self.__class__(idx=idx, cs=cs, sids=sids, cnt=cnt)
 
@@ -411,6 +501,7 @@ class Candidate:
     optimization problem.
     """
     Data = namedtuple('Data', 'os, sid')
+    __slots__ = ('_agent', '_idx', '_cs', '_sids', '_perf', '_agents')
 
     def __init__(self, agent, idx, cs, sids, perf):
         self._agent = agent
@@ -419,6 +510,7 @@ class Candidate:
         self._cs.setflags(write=False)
         self._sids = tuple(sids)
         self._perf = perf
+        self._agents = None  # Lazily computed sorted agent names
 
     def __eq__(self, other):
         return (
@@ -451,6 +543,13 @@ class Candidate:
         """List of schedule IDs for each OS in the cluster schedule."""
         return self._sids
 
+    @property
+    def agents(self):
+        """Sorted tuple of agent names (computed on first access)."""
+        if self._agents is None:
+            self._agents = tuple(sorted(self._idx))
+        return self._agents
+
     @property
     def perf(self):
         """Performance of this candidate."""
@@ -465,14 +564,11 @@ class Candidate:
         return the original *candidate_i* instance (unchanged).
 
         """
-        keyset_i = set(candidate_i.idx)
-        keyset_j = set(candidate_j.idx)
+        agents_i = candidate_i.agents
+        agents_j = candidate_j.agents
         candidate = candidate_i  # Default candidate is *i*
 
-        if keyset_i < keyset_j:
-            # Use *j* if *K_i* is a true subset of *K_j*
-            candidate = candidate_j
-        elif keyset_i == keyset_j:
+        if agents_i == agents_j:
             # Compare the performance if the keysets are equal
             if candidate_j.perf > candidate_i.perf:
                 # Choose *j* if it performs better
@@ -482,26 +578,32 @@ class Candidate:
                 if candidate_j.agent < candidate_i.agent:
                     candidate = candidate_j
 
-        # Keysets are not equal and keyset_i is NOT a true subset of keyset_j
-        elif keyset_j - keyset_i:
-            # If there are elements in keyset_j but not in keyset_i,
-            # update *candidate_i*
-            idx_map = {}
-            cs_buf = []
-            sids = []
+        else:
             # Index should be sorted by agent name (because determinism)
-            for i, a in enumerate(sorted(keyset_i | keyset_j)):
-                idx_map[a] = i
-                if a in keyset_i:
-                    data = candidate_i.data(a)
-                else:
-                    data = candidate_j.data(a)
-                cs_buf.append(data.os)
-                sids.append(data.sid)
-
-            cs = np.array(cs_buf)
-            perf = perf_func(cs)
-            candidate = Candidate(agent, idx_map, cs, sids, perf)
+            merged, n_common = _merge_sorted(agents_i, agents_j)
+            if n_common == len(agents_i):
+                # Use *j* if *K_i* is a true subset of *K_j*
+                candidate = candidate_j
+
+            # Keysets are not equal and keyset_i is NOT a true subset of
+            # keyset_j.  If there are elements in keyset_j but not in
+            # keyset_i, update *candidate_i*
+            elif n_common < len(agents_j):
+                idx_map = {}
+                cs = np.empty((len(merged), candidate_i.cs.shape[1]),
+                              dtype=candidate_i.cs.dtype)
+                sids = []
+                for i, (a, in_i) in enumerate(merged):
+                    idx_map[a] = i
+                    if in_i:
+                        data = candidate_i.data(a)
+                    else:
+                        data = candidate_j.data(a)
+                    cs[i] = data.os
+                    sids.append(data.sid)
+
+                perf = perf_func(cs)
+                candidate = Candidate(agent, idx_map, cs, sids, perf)
 
         # If "candidate" and "candidate_i" are equal,
         # they must also have the same identity
@@ -534,15 +636,30 @@ class Candidate:
 
 class WorkingMemory:
     """Stores all negotiation related state."""
+    __slots__ = ('neighbors', 'start', 'res', 'intervals', 'ts', 'weights',
+                 'ps', 'ps_matrix', 'ps_index', 'sysconf', 'candidate',
+                 'msgs_in', 'msgs_out')
+
     def __init__(self, neighbors, start, res, intervals, ts, weights, ps,
                  sysconf, candidate, msgs_in=0, msgs_out=0):
         self.neighbors = neighbors  # agent's neighbors
         self.start = start          # startdate
         self.res = res              # resolution of intervals (e.g. 15 minutes)
         self.intervals = intervals  # number of intervals per day
-        self.ts = ts                # target schedule
-        self.weights = weights      # weights
+        self.ts = np.ascontiguousarray(ts, dtype=np.float64)  # target schedule
+        self.weights = np.ascontiguousarray(weights, dtype=np.float64)  # weights
         self.ps = ps                # possible schedules
+        # Possible schedules as 2D array (one row per schedule) for
+        # evaluating them all at once.  Duplicates of a schedule can never
+        # be chosen (the first one always wins), so we drop them.
+        # ps_index[k] is the index in *ps* of row *k*.
+        self.ps_matrix = None
+        self.ps_index = None
+        if ps is not None:
+            ps_matrix = np.array([op for _, _, op in ps], dtype=float)
+            _, first = np.unique(ps_matrix, return_index=True, axis=0)
+            self.ps_index = np.sort(first)
+            self.ps_matrix = ps_matrix[self.ps_index]
 
         self.sysconf = sysconf      # current systemconfiguration
         self.candidate = candidate  # current best candidate
@@ -573,9 +690,5 @@ class WorkingMemory:
     def objective_function(self, cluster_schedule):
         # Return the negative(!) sum of all deviations, because bigger scores
         # mean better plans (e.g., -1 is better then -10).
-        # print('objective_function: ')
         sum_cs = cluster_schedule.sum(axis=0)  # sum for each interval
-        diff = np.abs(self.ts - sum_cs)  # deviation to the target schedeule
-        w_diff = diff * self.weights  # multiply with weight vector
-        result = -np.sum(w_diff)
-        return result
+        return -_weighted_deviation(self.ts, sum_cs, self.weights)
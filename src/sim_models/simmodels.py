@@ -2,14 +2,16 @@
 
 """
 
+import functools
 import io
 import json
 import arrow
 import os
 import lzma
 
+from concurrent.futures import ThreadPoolExecutor
 from os import listdir
-from os.path import isfile, join
+from os.path import getmtime, isfile, join
 
 from aiomas import expose
 
@@ -21,6 +23,92 @@ class NoSuchScheduleException(Exception):
     pass
 
 
+@functools.lru_cache(maxsize=128)
+def _read_schedule_file(schedule_file_path, mtime, start_date_requested,
+                        resolution, intervals):
+    """
+    Parse the schedule file *schedule_file_path* and return its possible
+    schedules as read-only 2D array (one row per schedule), or ``None`` if the
+    file does not match the requested start, resolution and intervals.
+
+    Parsed files are cached until their modification time changes; *mtime* is
+    only used as part of the cache key.
+    """
+    # open each production schedule_file_path and read the header
+    my_open = lzma.open if schedule_file_path.endswith('.xz') else io.open
+    with my_open(schedule_file_path, 'rt') as schedule_file:
+        header_line = next(schedule_file).strip()
+
+        # parse and verify meta data
+        headers = json.loads(header_line)
+        start_date_parsed = arrow.get(headers['start_time']).to('utc')
+        if start_date_parsed != start_date_requested:
+            return None
+        interval_seconds = headers['interval_minutes'] * 60
+        if interval_seconds != resolution:
+            return None
+
+        # read and verify possible schedules
+        content = schedule_file.read().splitlines()
+    if len(content) != intervals:
+        return None
+
+    # we found adequate schedules, parse them all at once.  np.fromstring()
+    # parses the joined cells in C; fall back to the (slower, but stricter)
+    # np.loadtxt() if the file contains more (or malformed) columns.
+    schedule_count = len(headers['cols'])
+    data = np.fromstring(','.join(content), dtype=np.float64, sep=',')
+    if data.size == intervals * schedule_count:
+        data = data.reshape(intervals, schedule_count)
+    else:
+        data = np.loadtxt(content, delimiter=',', dtype=np.float64,
+                          usecols=range(schedule_count), ndmin=2)
+    assert data.shape == (intervals, schedule_count)
+
+    # store the schedules as rows of one contiguous (schedules x intervals)
+    # matrix
+    schedules = np.ascontiguousarray(data.T)
+    schedules.setflags(write=False)  # Make the cached arrays read-only
+    return schedules
+
+
+@functools.lru_cache(maxsize=128)
+def _read_schedules(schedule_files, mtimes, start_date_requested, resolution,
+                    intervals):
+    """
+    Read all *schedule_files* (with the modification times *mtimes*) and
+    return a tuple *(possible_schedules, schedule_dict)* with the schedules
+    matching the requested start, resolution and intervals.
+
+    Results are cached and shared between all DERs using the same files, so
+    they must not be modified.
+    """
+    # read (and decompress) the files in parallel, but keep their order
+    def read(schedule_file_path, mtime):
+        return _read_schedule_file(schedule_file_path, mtime,
+                                   start_date_requested, resolution,
+                                   intervals)
+
+    max_workers = max(1, min(8, len(schedule_files)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(read, schedule_files, mtimes))
+
+    possible_schedules = []
+    schedule_dict = {}
+    for schedules in results:
+        if schedules is None:
+            continue
+
+        # fill possible_schedules list and schedule_dict, shift index if
+        # there are schedules already found.  Each schedule is a (read-only)
+        # view of a row of the file's matrix.
+        for index, schedule_new in enumerate(schedules, len(possible_schedules)):
+            schedule_dict[index] = schedule_new
+            possible_schedules.append((index, 0, schedule_new))
+
+    return tuple(possible_schedules), schedule_dict
+
+
 class DER(UnitModel):
     """
     Simulator for a number of DERs.
@@ -76,48 +164,15 @@ class DER(UnitModel):
         start_date_requested = arrow.get(start).to('utc')
 
 
-        # search for a schedule with the given parameters
-        self._schedule_dict = {}
-        self._possible_schedules = []
-        for schedule_file_path in self._schedule_files:
-
-            # open each production schedule_file_path and read the header
-            schedule_file = lzma.open(schedule_file_path, 'rt') \
-                if schedule_file_path.endswith('.xz') else \
-                io.open(schedule_file_path, 'rt')
-            header_line = next(schedule_file).strip()
-
-            # parse and verify meta data
-            headers = json.loads(header_line)
-            start_date_parsed = arrow.get(headers['start_time']).to('utc')
-            if start_date_parsed != start_date_requested:
-                continue
-            interval_seconds = headers['interval_minutes'] * 60
-            if interval_seconds != resolution:
-                continue
-
-            # read and verify possible schedules
-            content = schedule_file.readlines()
-            if len(content) != intervals:
-                continue
-
-            # we found adequate schedules
-            possible_schedules = []
-            schedule_count = len(headers['cols'])
-            for index in range(schedule_count):
-                possible_schedules.append([])
-
-            # extract the data per schedule
-            for line in content:
-                data = line.strip().split(',')
-                for n in range(schedule_count):
-                    possible_schedules[n].append(float(data[n]))
-
-            # fill possible_schedules list and schedule_dict, shift index if there are schedules already found
-            for index, schedule in enumerate(possible_schedules, len(self._possible_schedules)):
-                schedule_new = np.array(schedule)
-                self._schedule_dict[index] = schedule_new
-                self._possible_schedules.append([index, 0, schedule_new])
+        # search for a schedule with the given parameters.  DERs using the
+        # same files share the (cached) result.
+        schedule_files = tuple(self._schedule_files)
+        mtimes = tuple(getmtime(f) for f in schedule_files)
+        possible_schedules, schedule_dict = _read_schedules(
+            schedule_files, mtimes, start_date_requested, resolution,
+            intervals)
+        self._possible_schedules = list(possible_schedules)
+        self._schedule_dict = dict(schedule_dict)
 
         # raise exception if no schedule has been found.
         if not self._possible_schedules:
@@ -1,11 +1,85 @@
 import asyncio
-from asyncio import coroutine
+import functools
 import random
+import sys
+import weakref
 
 from aiomas import expose
 import aiomas
 
 
+# Bounds the number of UnitAgents of this process that connect to the
+# controller and observer at the same time (see configure_connect_gate()).
+_connect_gate = None
+
+
+def configure_connect_gate(max_concurrent):
+    """Let at most *max_concurrent* UnitAgents (created by
+    :meth:`UnitAgent.factory()`) connect to the controller and observer at
+    the same time.
+
+    Agents then no longer sleep a random time before connecting.  Pass
+    ``None`` to restore that behavior.  Must be called from within the
+    running event loop.
+    """
+    global _connect_gate
+    if max_concurrent is None:
+        _connect_gate = None
+    else:
+        _connect_gate = asyncio.Semaphore(max_concurrent)
+
+
+# Exposed no-op function shared by all UnitAgents without a unit interface
+_null_sink = aiomas.rpc.expose(lambda *args, **kwargs: None)
+
+
+# Proxies to the controller and observer shared by all UnitAgents of a
+# container; container: {addr: future of the proxy}
+_proxy_cache = weakref.WeakKeyDictionary()
+
+
+async def _connect(container, addr):
+    """Return a proxy to the agent at *addr*.
+
+    The proxy is shared by all UnitAgents in *container*, so that only the
+    first of them actually connects to *addr*.
+    """
+    proxies = _proxy_cache.setdefault(container, {})
+    fut = proxies.get(addr)
+    if fut is None:
+        fut = asyncio.ensure_future(container.connect(addr))
+        proxies[addr] = fut
+    try:
+        # The future is shared with other agents, don't cancel it for them
+        return await asyncio.shield(fut)
+    finally:
+        # Let the next agent try again if connecting failed
+        if fut.done() and (fut.cancelled() or fut.exception() is not None):
+            if proxies.get(addr) is fut:
+                del proxies[addr]
+
+
+@functools.lru_cache(maxsize=None)
+def _resolve_cls(clsname):
+    """Return the class for *clsname* (``'module:ClassName'``).  If
+    *clsname* already is a class, return it unchanged.
+
+    Resolved classes are cached, so the import is only done once per class.
+    """
+    if isinstance(clsname, type):
+        return clsname
+    return aiomas.util.obj_from_str(clsname)
+
+
+def _create(spec, *args):
+    """Create an instance from the tuple *spec* = *(clsname, config)*.
+
+    *args* are passed to the class before the keyword arguments in *config*.
+    """
+    clsname, config = spec
+    return _resolve_cls(clsname)(*args, **config)
+
+
 class UnitAgent(aiomas.Agent):
     """ The unitAgent is the center of the planning procedure.
 
@@ -16,6 +90,23 @@ class UnitAgent(aiomas.Agent):
     It talks to the actual unit via its unit interface *unit_if*.
 
     """
+    # (function, attribute) of the exposed functions of the model, planner and
+    # unit that are aliased by the agent
+    _ALIAS_TABLE = (
+        # for the ControllerAgent
+        ('set_possible_schedules', 'model'),
+        ('store_topology', 'planner'),
+        ('init_negotiation', 'planner'),
+        ('stop_negotiation', 'planner'),
+        ('set_schedule', 'unit'),
+        ('new_negotiation', 'unit'),
+        ('get_current_schedule', 'unit'),
+        # for other UnitAgents
+        ('update', 'planner'),
+    )
+    __slots__ = ('ctrl_agent', 'obs_agent', 'name', 'model', 'unit',
+                 'planner') + tuple(attr for attr, _ in _ALIAS_TABLE)
+
     @classmethod
     async def factory(
             cls, container, *, ctrl_agent_addr, obs_agent_addr, unit_model,
@@ -30,27 +121,91 @@ class UnitAgent(aiomas.Agent):
         :param unit_model: A tuple of (classname, config) for the unitModel
         :param unit_if: A tuple of (classname, config) for the unit
         :param planner: A tuple of (classname, config) for the planner
+                (instead of a classname, each tuple may also contain the
+                class itself)
         :param sleep_before_connect: If true, unitAgent will sleep some random
-                time before connecting to controller/observer to avoid that all
-                agents try to connect at the same time
+                time (at most one second or, if it is a number, that many
+                seconds) before connecting to controller/observer to avoid
+                that all agents try to connect at the same time.  Ignored if
+                the number of concurrent connects is bounded via
+                :func:`configure_connect_gate()`.
         :return: The instance of the unitAgent
         
         """
-        # Sleep a short time to avoid that all agents try to connect to the
-        # ctrl_agent at the same time.
-        if sleep_before_connect:
-            await asyncio.sleep(
-                float(sleep_before_connect) * random.random())
-
-        ctrl_agent = await container.connect(ctrl_agent_addr)
-        obs_agent = await container.connect(obs_agent_addr)
+        # Connecting to and registering at the controller and observer are
+        # independent, so do both at the same time.
+        if _connect_gate is not None:
+            # Wait until the number of concurrent connects allows us to
+            # connect to the ctrl_agent.
+            async with _connect_gate:
+                ctrl_agent, obs_agent = await asyncio.gather(
+                    _connect(container, ctrl_agent_addr),
+                    _connect(container, obs_agent_addr))
+        else:
+            # Sleep a short time to avoid that all agents try to connect to
+            # the ctrl_agent at the same time.
+            if sleep_before_connect:
+                if sleep_before_connect is True:
+                    sleep_before_connect = 1.0
+                await asyncio.sleep(sleep_before_connect * random.random())
+            ctrl_agent, obs_agent = await asyncio.gather(
+                _connect(container, ctrl_agent_addr),
+                _connect(container, obs_agent_addr))
         agent = cls(container, ctrl_agent, obs_agent,
                     unit_model, unit_if, planner, unit_name)
-        await ctrl_agent.register_unitAgent(agent, agent.addr, unit_name)
-        await obs_agent.register_unitAgent(agent, agent.addr, unit_name)
+        addr = agent.addr
+        await asyncio.gather(
+            ctrl_agent.register_unitAgent(agent, addr, unit_name),
+            obs_agent.register_unitAgent(agent, addr, unit_name))
 
         return agent
 
+    @classmethod
+    def preresolve(cls, specs):
+        """
+        Import and cache the classes of the *(classname, config)* tuples in
+        *specs* (``None`` entries are ignored), so that creating agents with
+        :meth:`factory()` or :meth:`factory_many()` later won't need to
+        import anything.
+        """
+        for spec in specs:
+            if spec is not None:
+                _resolve_cls(spec[0])
+
+    @classmethod
+    async def factory_many(cls, container, *, ctrl_agent_addr,
+                           obs_agent_addr, specs):
+        """
+        Use this method to create many unitAgents in one container at once.
+        All agents share the proxies to the controller and observer and are
+        registered there with a single call.
+        :param container: The container, in which the agents should live
+        :param ctrl_agent_addr: Address of the controller agent
+        :param obs_agent_addr: Address of the observer agent
+        :param specs: A list of dicts with the keyword arguments *unit_model*,
+                *planner* and (optionally) *unit_if* and *unit_name* for
+                each agent (see :meth:`factory()`)
+        :return: The list of unitAgent instances (in the order of *specs*)
+
+        """
+        ctrl_agent, obs_agent = await asyncio.gather(
+            _connect(container, ctrl_agent_addr),
+            _connect(container, obs_agent_addr))
+        agents = []
+        registrations = []
+        for spec in specs:
+            unit_name = spec.get('unit_name')
+            agent = cls(container, ctrl_agent, obs_agent,
+                        spec['unit_model'], spec.get('unit_if'),
+                        spec['planner'], unit_name)
+            agents.append(agent)
+            registrations.append((agent, agent.addr, unit_name))
+        await asyncio.gather(
+            ctrl_agent.register_unitAgents(registrations),
+            obs_agent.register_unitAgents(registrations))
+
+        return agents
+
     def __init__(self, container, ctrl_agent, obs_agent, unit_model,
                  unit_if, planner, unit_name=None):
         """
@@ -61,50 +216,35 @@ class UnitAgent(aiomas.Agent):
         
         self.ctrl_agent = ctrl_agent
         self.obs_agent = obs_agent
-        self.name = unit_name if unit_name else self.addr
+        # Names are used as dict keys, so intern them (only str can be
+        # interned, other names are used as they are)
+        self.name = (sys.intern(unit_name)
+                     if isinstance(unit_name, str) and unit_name
+                     else (unit_name or self.addr))
         
-        # create a unit_model
-        clsname, config = unit_model
-        cls = aiomas.util.obj_from_str(clsname)
-
-        self.model = cls(**config)
+        # create the unit_model, the unit and the planner
+        self.model = _create(unit_model)
+        self.unit = _create(unit_if, self) if unit_if else None
+        self.planner = _create(planner, self)
         assert isinstance(self.model, UnitModel)
-
-        # create the unit
-        if unit_if:
-            clsname, config = unit_if
-            cls = aiomas.util.obj_from_str(clsname)
-            self.unit = cls(self, **config)
-            assert isinstance(self.unit, UnitInterface)
-        else:
-            self.unit = None
-
-        # create the planner
-        clsname, config = planner
-        cls = aiomas.util.obj_from_str(clsname)
-        self.planner = cls(self, **config)
+        assert self.unit is None or isinstance(self.unit, UnitInterface)
         assert isinstance(self.planner, Planner)
 
-        # Expose/alias functions for the ControllerAgent
-        self.set_possible_schedules = self.model.set_possible_schedules
-
-        self.store_topology = self.planner.store_topology
-        self.init_negotiation = self.planner.init_negotiation
-        self.stop_negotiation = self.planner.stop_negotiation
-
-        if self.unit is not None:
-            self.set_schedule = self.unit.set_schedule
-            self.new_negotiation = self.unit.new_negotiation
-            self.get_current_schedule = self.unit.get_current_schedule
-        else:
-           self.new_negotiation = self.get_current_schedule = aiomas.rpc.expose(lambda: None)
-           self.set_schedule = aiomas.rpc.expose(lambda x: None)
+        # Expose/alias functions for the ControllerAgent and other UnitAgents
+        for attr, target in self._ALIAS_TABLE:
+            target = getattr(self, target)
+            if target is not None:
+                setattr(self, attr, getattr(target, attr))
 
-        # Expose/alias function for other UnitAgents
-        self.update = self.planner.update
+        if self.unit is None:
+            self.new_negotiation = self.get_current_schedule = \
+                self.set_schedule = _null_sink
 
     @expose  # Called by a Management agent (e.g., mosaik API)
     def stop(self):
+        # Not aliased like the functions in _ALIAS_TABLE: Planner.stop() is
+        # not exposed and expose() cannot mark a bound method, so keep this
+        # (single) wrapper instead of adding more indirection.
         self.planner.stop()
 
 
@@ -135,6 +275,8 @@ class UnitModel:
 
 
 class UnitInterface:
+    # The service creates a router per instance, so subclasses can share it
+    # via "router = UnitInterface.router" unless they need a different one.
     router = aiomas.rpc.Service()
 
     def __init__(self, agent, **config):
@@ -165,9 +307,8 @@ class Planner:
         raise NotImplementedError
 
     @expose
-    @coroutine
-    def init_negotiation(self, neighbors, start, res, target_schedule, weights,
-                         send_wm):
+    async def init_negotiation(self, neighbors, start, res, target_schedule,
+                               weights, send_wm):
         raise NotImplementedError
 
     @expose